@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import logging
+from textwrap import wrap
 
 from repairwheel._vendor.auditwheel.policy import WheelPolicies
 
@@ -15,8 +16,6 @@ def configure_parser(sub_parsers):
 
 
 def printp(text: str) -> None:
-    from textwrap import wrap
-
     print()
     print("\n".join(wrap(text, break_long_words=False, break_on_hyphens=False)))
 
@@ -102,11 +101,13 @@ def execute(args, p):
         printp("The wheel requires no external shared libraries! :)")
     else:
         printp("The following external shared libraries are required " "by the wheel:")
-        print(json.dumps(dict(sorted(libs.items())), indent=4))
+        print(json.dumps(libs, indent=4, sort_keys=True))
 
+    overall_priority = wheel_policy.get_priority_by_name(winfo.overall_tag)
     for p in sorted(wheel_policy.policies, key=lambda p: p["priority"]):
-        if p["priority"] > wheel_policy.get_priority_by_name(winfo.overall_tag):
-            libs = winfo.external_refs[p["name"]]["libs"]
+        if p["priority"] > overall_priority:
+            external_refs = winfo.external_refs[p["name"]]
+            libs = external_refs["libs"]
             if len(libs):
                 printp(
                     (
@@ -117,7 +118,7 @@ def execute(args, p):
                     % p["name"]
                 )
                 printp(", ".join(sorted(libs.keys())))
-            blacklist = winfo.external_refs[p["name"]]["blacklist"]
+            blacklist = external_refs["blacklist"]
             if len(blacklist):
                 printp(
                     (
@@ -53,6 +53,7 @@ class WheelPolicies:
         self._arch_name = arch
         self._libc_variant = libc
         self._musl_policy = musl_policy
+        self._policy_sym_vers: list[tuple[dict, dict[str, set[str]]]] | None = None
 
         _validate_pep600_compliance(policies)
         for policy in policies:
@@ -81,6 +82,13 @@ class WheelPolicies:
         if self._libc_variant == Libc.MUSL:
             assert len(self._policies) == 2, self._policies
 
+        self._policies_by_name: dict[str, dict] = {}
+        for policy in self._policies:
+            for name in [policy["name"], *policy["aliases"]]:
+                if name in self._policies_by_name:
+                    raise RuntimeError("Internal error. Policies should be unique")
+                self._policies_by_name[name] = policy
+
     @property
     def policies(self):
         return self._policies
@@ -94,14 +102,7 @@ class WheelPolicies:
         return min(p["priority"] for p in self._policies)
 
     def get_policy_by_name(self, name: str) -> dict | None:
-        matches = [
-            p for p in self._policies if p["name"] == name or name in p["aliases"]
-        ]
-        if len(matches) == 0:
-            return None
-        if len(matches) > 1:
-            raise RuntimeError("Internal error. Policies should be unique")
-        return matches[0]
+        return self._policies_by_name.get(name)
 
     def get_policy_name(self, priority: int) -> str | None:
         matches = [p["name"] for p in self._policies if p["priority"] == priority]
@@ -115,13 +116,32 @@ class WheelPolicies:
         policy = self.get_policy_by_name(name)
         return None if policy is None else policy["priority"]
 
+    def _get_policy_sym_vers(self) -> list[tuple[dict, dict[str, set[str]]]]:
+        # The "<sym_name>_<version>" sets only depend on the policies, so build
+        # them once rather than on every versioned_symbols_policy call.
+        if self._policy_sym_vers is None:
+            self._policy_sym_vers = [
+                (
+                    p,
+                    {
+                        sym_name: {sym_name + "_" + version for version in versions}
+                        for sym_name, versions in p["symbol_versions"].items()
+                    },
+                )
+                for p in self.policies
+            ]
+        return self._policy_sym_vers
+
     def versioned_symbols_policy(self, versioned_symbols: dict[str, set[str]]) -> int:
         def policy_is_satisfied(
             policy_name: str, policy_sym_vers: dict[str, set[str]]
         ) -> bool:
             policy_satisfied = True
-            for name in set(required_vers) & set(policy_sym_vers):
+            for name in required_vers.keys() & policy_sym_vers.keys():
                 if not required_vers[name].issubset(policy_sym_vers[name]):
+                    if not log_unsatisfied:
+                        # No need to find every missing symbol if they're not logged
+                        return False
                     for symbol in required_vers[name] - policy_sym_vers[name]:
                         logger.debug(
                             "Package requires %s, incompatible with "
@@ -133,17 +153,14 @@ class WheelPolicies:
                     policy_satisfied = False
             return policy_satisfied
 
+        log_unsatisfied = logger.isEnabledFor(logging.DEBUG)
         required_vers: dict[str, set[str]] = {}
         for symbols in versioned_symbols.values():
             for symbol in symbols:
                 sym_name, _, _ = symbol.partition("_")
                 required_vers.setdefault(sym_name, set()).add(symbol)
         matching_policies: list[int] = []
-        for p in self.policies:
-            policy_sym_vers = {
-                sym_name: {sym_name + "_" + version for version in versions}
-                for sym_name, versions in p["symbol_versions"].items()
-            }
+        for p, policy_sym_vers in self._get_policy_sym_vers():
             if policy_is_satisfied(p["name"], policy_sym_vers):
                 matching_policies.append(p["priority"])
 
@@ -1,51 +1,133 @@
+import errno
 import os
 from typing import BinaryIO
 from typing import IO
+from typing import Optional
 
-BUFSIZE = 8192
+BUFSIZE = 1024 * 1024
+
+# A shared source of zero bytes for fzero; immutable, so it's allocated only once.
+_ZEROS = bytes(BUFSIZE)
 
 
 def open_create(name: str, flags: int) -> IO:
     return os.open(name, flags | os.O_CREAT)
 
 
+def _fileno(fh: BinaryIO) -> Optional[int]:
+    """Returns the file descriptor backing fh, or None if there isn't one."""
+    try:
+        return fh.fileno()
+    except (AttributeError, OSError):  # io.UnsupportedOperation is an OSError
+        return None
+
+
 def fzero(fh: BinaryIO, offset: int, length: int, bufsize: int = BUFSIZE) -> None:
+    zeros = memoryview(_ZEROS if bufsize <= len(_ZEROS) else bytes(bufsize))[:bufsize]
+    end = offset + length
+
+    fd = _fileno(fh) if hasattr(os, "pwrite") else None
+    if fd is not None:
+        # Write directly to the descriptor at explicit offsets. Flushing first pushes out any
+        # pending buffered writes and discards fh's read buffer so it can't go stale.
+        fh.flush()
+        # Only the part that overlaps existing data needs to be written. Anything past EOF is
+        # zeroed by extending the file, which filesystems can do without writing any blocks.
+        file_size = os.fstat(fd).st_size
+        write_end = min(end, max(offset, file_size))
+        if end > max(offset, file_size):
+            os.ftruncate(fd, end)
+        while offset < write_end:
+            offset += os.pwrite(fd, zeros[: write_end - offset], offset)
+        fh.seek(end)
+        return
+
     fh.seek(offset)
-    zeros = b"\0" * bufsize
-    while length > 0:
-        write_size = min(length, bufsize)
-        written = fh.write(zeros[:write_size])
-        length -= written
+    while offset < end:
+        offset += fh.write(zeros[: end - offset])
+
+
+def _copy_range(fd: int, dst: int, src: int, length: int) -> int:
+    """Copies length bytes from src to dst within fd, stopping early at EOF. Returns the number copied."""
+    copied = 0
+    while copied < length:
+        n = os.copy_file_range(fd, fd, length - copied, src + copied, dst + copied)
+        if not n:
+            break
+        copied += n
+    return copied
+
+
+def _fmove_in_kernel(fd: int, dst: int, src: int, length: int) -> bool:
+    """Moves data with os.copy_file_range. Returns False if the kernel or filesystem can't do it."""
+    # copy_file_range refuses overlapping ranges within a single file, so each chunk is limited
+    # to the distance between src and dst, and chunks are taken from the head when moving down
+    # and from the tail when moving up so that no chunk overwrites data that's yet to be moved.
+    step = abs(dst - src)
+    moved = 0
+    try:
+        while moved < length:
+            n = min(length - moved, step)
+            offset = moved if dst < src else length - moved - n
+            copied = _copy_range(fd, dst + offset, src + offset, n)
+            moved += n
+            if copied < n and dst < src:
+                break  # Reached EOF; there's nothing more to move.
+    except OSError as e:
+        # Unsupported across filesystems, on older kernels, or on some filesystem types.
+        if moved == 0 and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP, errno.EINVAL):
+            return False
+        raise
+    return True
 
 
 def fmove(fh: BinaryIO, dst: int, src: int, length: int, bufsize: int = BUFSIZE) -> None:
     if dst == src:
         return
 
-    buf = bytearray()
+    # Each copy_file_range call is limited to the distance moved, so small shifts would take a syscall per few bytes.
+    # Those are left to the buffered loop below.
+    fd = _fileno(fh) if hasattr(os, "copy_file_range") and abs(dst - src) >= bufsize else None
+    if fd is not None:
+        fh.flush()
+        # Only move data that exists. Otherwise, once the destination extends the file, data past the
+        # original EOF would be "moved" too.
+        length = max(0, min(length, os.fstat(fd).st_size - src))
+        if _fmove_in_kernel(fd, dst, src, length):
+            return
+
+    # A single buffer is reused for every chunk rather than allocating a new bytes object per read.
+    buf = memoryview(bytearray(min(length, bufsize)))
 
     if dst < src:
         while length != 0:
             to_move = min(length, bufsize)
             fh.seek(src)
-            buf = fh.read(to_move)
+            read = fh.readinto(buf[:to_move])
+            if not read:
+                break  # Reached EOF; there's nothing more to move.
             fh.seek(dst)
-            written = fh.write(buf)
+            fh.write(buf[:read])
 
-            length -= written
-            src += written
-            dst += written
+            length -= read
+            src += read
+            dst += read
 
     else:
         while length != 0:
             to_move = min(length, bufsize)
             fh.seek(src + length - to_move)
-            buf = fh.read(to_move)
+            # A short read means this chunk runs past EOF, and only the data that exists is moved.
+            read = fh.readinto(buf[:to_move])
             fh.seek(dst + length - to_move)
-            written = fh.write(buf)
+            fh.write(buf[:read])
 
-            length -= written
+            length -= to_move
 
 
 def round_to_multiple(num: int, multiple: int) -> int:
-    return ((num + multiple - 1) // multiple) * multiple
+    mask = multiple - 1
+    if multiple > 0 and not multiple & mask:
+        # Alignments are almost always powers of two, which can be rounded with a mask.
+        return (num + mask) & ~mask
+    return ((num + mask) // multiple) * multiple
@@ -1,25 +1,24 @@
 from contextlib import contextmanager
 import copy
 from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import fields
 import io
+import mmap
+import struct
+from typing import Any
 from typing import BinaryIO
+from typing import ClassVar
 from typing import Dict
 from typing import Generator
 from typing import List
 from typing import Optional
 from typing import Set
 from typing import Tuple
+from typing import Type
+from typing import TypeVar
 from typing import Union
 
-from macholib.ptypes import Structure
-from macholib.ptypes import p_int32
-from macholib.ptypes import p_int64
-from macholib.ptypes import p_uint8
-from macholib.ptypes import p_uint16
-from macholib.ptypes import p_uint32
-from macholib.ptypes import p_uint64
-from macholib.ptypes import sizeof
-
 from ..fileutil import fzero
 from ..fileutil import round_to_multiple
 
@@ -32,22 +31,8 @@ except ImportError:
 # https://www.cs.cmu.edu/afs/cs/academic/class/15213-f00/docs/elf.pdf
 
 
-Elf32_Half = p_uint16
-Elf32_Word = p_uint32
-Elf32_Sword = p_int32
-Elf32_Addr = p_uint32
-Elf32_Off = p_uint32
-
-Elf64_Half = p_uint16
-Elf64_Word = p_uint32
-Elf64_Sword = p_int32
-Elf64_Xword = p_uint64
-Elf64_Sxword = p_int64
-Elf64_Addr = p_uint64
-Elf64_Off = p_uint64
-
-# The four ELF magic number parts
-ELF_MAGIC = (0x7F, ord("E"), ord("L"), ord("F"))
+# The ELF magic number that starts e_ident
+ELF_MAGIC = b"\x7fELF"
 
 ELFCLASS32 = 1
 ELFCLASS64 = 2
@@ -87,321 +72,358 @@ DT_VERNEED = 0x6FFFFFFE
 DT_VERNEEDNUM = 0x6FFFFFFF
 
 
-class ElfIdent(Structure):
-    _fields_ = [
-        ("ei_mag0", p_uint8),
-        ("ei_mag1", p_uint8),
-        ("ei_mag2", p_uint8),
-        ("ei_mag3", p_uint8),
-        ("ei_class", p_uint8),
-        ("ei_data", p_uint8),
-        ("ei_version", p_uint8),
-        ("ei_osabi", p_uint8),
-        ("ei_abiversion", p_uint8),
-        ("ei_pad1", p_uint8),
-        ("ei_pad2", p_uint8),
-        ("ei_pad3", p_uint8),
-        ("ei_pad4", p_uint8),
-        ("ei_pad5", p_uint8),
-        ("ei_pad6", p_uint8),
-        ("ei_pad7", p_uint8),
-    ]
-
-
-_Elf32_Ehdr_fields = [
-    *ElfIdent._fields_,
-    ("e_type", Elf32_Half),
-    ("e_machine", Elf32_Half),
-    ("e_version", Elf32_Word),
-    ("e_entry", Elf32_Addr),
-    ("e_phoff", Elf32_Off),
-    ("e_shoff", Elf32_Off),
-    ("e_flags", Elf32_Word),
-    ("e_ehsize", Elf32_Half),
-    ("e_phentsize", Elf32_Half),
-    ("e_phnum", Elf32_Half),
-    ("e_shentsize", Elf32_Half),
-    ("e_shnum", Elf32_Half),
-    ("e_shstrndx", Elf32_Half),
-]
-
-
-class Elf32_Ehdr_BE(Structure):
-    _endian_ = ">"
-    _fields_ = _Elf32_Ehdr_fields
+_R = TypeVar("_R", bound="ElfRecord")
 
 
-class Elf32_Ehdr_LE(Structure):
-    _endian_ = "<"
-    _fields_ = _Elf32_Ehdr_fields
-
-
-_Elf64_Ehdr_fields = [
-    *ElfIdent._fields_,
-    ("e_type", Elf64_Half),
-    ("e_machine", Elf64_Half),
-    ("e_version", Elf64_Word),
-    ("e_entry", Elf64_Addr),
-    ("e_phoff", Elf64_Off),
-    ("e_shoff", Elf64_Off),
-    ("e_flags", Elf64_Word),
-    ("e_ehsize", Elf64_Half),
-    ("e_phentsize", Elf64_Half),
-    ("e_phnum", Elf64_Half),
-    ("e_shentsize", Elf64_Half),
-    ("e_shnum", Elf64_Half),
-    ("e_shstrndx", Elf64_Half),
-]
-
-
-class Elf64_Ehdr_BE(Structure):
-    _endian_ = ">"
-    _fields_ = _Elf64_Ehdr_fields
+class ElfRecord:
+    """Base for fixed-size records that are packed and unpacked with a single precompiled struct.
 
+    Subclasses are dataclasses that set _format_; concrete (endian-specific) subclasses also set _endian_.
+    """
 
-class Elf64_Ehdr_LE(Structure):
-    _endian_ = "<"
-    _fields_ = _Elf64_Ehdr_fields
+    _endian_: ClassVar[str]
+    _format_: ClassVar[str]
+    _struct_: ClassVar[struct.Struct]
+    _field_names_: ClassVar[Tuple[str, ...]]
+    size: ClassVar[int]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        if "_endian_" in cls.__dict__:
+            # Concrete subclasses aren't decorated themselves, so their fields are the parent dataclass's.
+            cls._struct_ = struct.Struct(cls._endian_ + cls._format_)
+            cls._field_names_ = tuple(f.name for f in fields(cls))
+            cls.size = cls._struct_.size
 
+    @classmethod
+    def from_tuple(cls: Type[_R], values: Tuple[int, ...]) -> _R:
+        return cls(*values)
 
-_Elf32_Phdr_fields = [
-    ("p_type", Elf32_Word),
-    ("p_offset", Elf32_Off),
-    ("p_vaddr", Elf32_Addr),
-    ("p_paddr", Elf32_Addr),
-    ("p_filesz", Elf32_Word),
-    ("p_memsz", Elf32_Word),
-    ("p_flags", Elf32_Word),
-    ("p_align", Elf32_Word),
-]
+    def to_bytes(self) -> bytes:
+        return self._struct_.pack(*[getattr(self, name) for name in self._field_names_])
 
+    def to_fileobj(self, fh: BinaryIO) -> None:
+        fh.write(self.to_bytes())
 
-class Elf32_Phdr_BE(Structure):
+
+@dataclass
+class ElfIdent(ElfRecord):
+    _format_ = "16B"
+
+    ei_mag0: int = 0
+    ei_mag1: int = 0
+    ei_mag2: int = 0
+    ei_mag3: int = 0
+    ei_class: int = 0
+    ei_data: int = 0
+    ei_version: int = 0
+    ei_osabi: int = 0
+    ei_abiversion: int = 0
+    ei_pad1: int = 0
+    ei_pad2: int = 0
+    ei_pad3: int = 0
+    ei_pad4: int = 0
+    ei_pad5: int = 0
+    ei_pad6: int = 0
+    ei_pad7: int = 0
+
+
+class ElfIdent_LE(ElfIdent):
+    _endian_ = "<"  # All single bytes, so byte order doesn't matter.
+
+
+@dataclass
+class Elf32_Ehdr(ElfIdent):
+    _format_ = ElfIdent._format_ + "HHIIIIIHHHHHH"
+
+    e_type: int = 0  # Elf32_Half
+    e_machine: int = 0  # Elf32_Half
+    e_version: int = 0  # Elf32_Word
+    e_entry: int = 0  # Elf32_Addr
+    e_phoff: int = 0  # Elf32_Off
+    e_shoff: int = 0  # Elf32_Off
+    e_flags: int = 0  # Elf32_Word
+    e_ehsize: int = 0  # Elf32_Half
+    e_phentsize: int = 0  # Elf32_Half
+    e_phnum: int = 0  # Elf32_Half
+    e_shentsize: int = 0  # Elf32_Half
+    e_shnum: int = 0  # Elf32_Half
+    e_shstrndx: int = 0  # Elf32_Half
+
+
+class Elf32_Ehdr_BE(Elf32_Ehdr):
     _endian_ = ">"
-    _fields_ = _Elf32_Phdr_fields
 
 
-class Elf32_Phdr_LE(Structure):
+class Elf32_Ehdr_LE(Elf32_Ehdr):
     _endian_ = "<"
-    _fields_ = _Elf32_Phdr_fields
 
 
-_Elf64_Phdr_fields = [
-    ("p_type", Elf64_Word),
-    ("p_flags", Elf64_Word),
-    ("p_offset", Elf64_Off),
-    ("p_vaddr", Elf64_Addr),
-    ("p_paddr", Elf64_Addr),
-    ("p_filesz", Elf64_Xword),
-    ("p_memsz", Elf64_Xword),
-    ("p_align", Elf64_Xword),
-]
+@dataclass
+class Elf64_Ehdr(ElfIdent):
+    _format_ = ElfIdent._format_ + "HHIQQQIHHHHHH"
+
+    e_type: int = 0  # Elf64_Half
+    e_machine: int = 0  # Elf64_Half
+    e_version: int = 0  # Elf64_Word
+    e_entry: int = 0  # Elf64_Addr
+    e_phoff: int = 0  # Elf64_Off
+    e_shoff: int = 0  # Elf64_Off
+    e_flags: int = 0  # Elf64_Word
+    e_ehsize: int = 0  # Elf64_Half
+    e_phentsize: int = 0  # Elf64_Half
+    e_phnum: int = 0  # Elf64_Half
+    e_shentsize: int = 0  # Elf64_Half
+    e_shnum: int = 0  # Elf64_Half
+    e_shstrndx: int = 0  # Elf64_Half
+
+
+class Elf64_Ehdr_BE(Elf64_Ehdr):
+    _endian_ = ">"
 
 
-class Elf64_Phdr_BE(Structure):
+class Elf64_Ehdr_LE(Elf64_Ehdr):
+    _endian_ = "<"
+
+
+@dataclass
+class Elf32_Phdr(ElfRecord):
+    _format_ = "IIIIIIII"
+
+    p_type: int = 0  # Elf32_Word
+    p_offset: int = 0  # Elf32_Off
+    p_vaddr: int = 0  # Elf32_Addr
+    p_paddr: int = 0  # Elf32_Addr
+    p_filesz: int = 0  # Elf32_Word
+    p_memsz: int = 0  # Elf32_Word
+    p_flags: int = 0  # Elf32_Word
+    p_align: int = 0  # Elf32_Word
+
+
+class Elf32_Phdr_BE(Elf32_Phdr):
     _endian_ = ">"
-    _fields_ = _Elf64_Phdr_fields
 
 
-class Elf64_Phdr_LE(Structure):
+class Elf32_Phdr_LE(Elf32_Phdr):
     _endian_ = "<"
-    _fields_ = _Elf64_Phdr_fields
 
 
-_Elf32_Shdr_fields = [
-    ("sh_name", Elf32_Word),
-    ("sh_type", Elf32_Word),
-    ("sh_flags", Elf32_Word),
-    ("sh_addr", Elf32_Addr),
-    ("sh_offset", Elf32_Off),
-    ("sh_size", Elf32_Word),
-    ("sh_link", Elf32_Word),
-    ("sh_info", Elf32_Word),
-    ("sh_addralign", Elf32_Word),
-    ("sh_entsize", Elf32_Word),
-]
+@dataclass
+class Elf64_Phdr(ElfRecord):
+    _format_ = "IIQQQQQQ"
+
+    p_type: int = 0  # Elf64_Word
+    p_flags: int = 0  # Elf64_Word
+    p_offset: int = 0  # Elf64_Off
+    p_vaddr: int = 0  # Elf64_Addr
+    p_paddr: int = 0  # Elf64_Addr
+    p_filesz: int = 0  # Elf64_Xword
+    p_memsz: int = 0  # Elf64_Xword
+    p_align: int = 0  # Elf64_Xword
 
 
-class Elf32_Shdr_BE(Structure):
+class Elf64_Phdr_BE(Elf64_Phdr):
     _endian_ = ">"
-    _fields_ = _Elf32_Shdr_fields
 
 
-class Elf32_Shdr_LE(Structure):
+class Elf64_Phdr_LE(Elf64_Phdr):
     _endian_ = "<"
-    _fields_ = _Elf32_Shdr_fields
 
 
-_Elf64_Shdr_fields = [
-    ("sh_name", Elf64_Word),
-    ("sh_type", Elf64_Word),
-    ("sh_flags", Elf64_Xword),
-    ("sh_addr", Elf64_Addr),
-    ("sh_offset", Elf64_Off),
-    ("sh_size", Elf64_Xword),
-    ("sh_link", Elf64_Word),
-    ("sh_info", Elf64_Word),
-    ("sh_addralign", Elf64_Xword),
-    ("sh_entsize", Elf64_Xword),
-]
+@dataclass
+class Elf32_Shdr(ElfRecord):
+    _format_ = "IIIIIIIIII"
+
+    sh_name: int = 0  # Elf32_Word
+    sh_type: int = 0  # Elf32_Word
+    sh_flags: int = 0  # Elf32_Word
+    sh_addr: int = 0  # Elf32_Addr
+    sh_offset: int = 0  # Elf32_Off
+    sh_size: int = 0  # Elf32_Word
+    sh_link: int = 0  # Elf32_Word
+    sh_info: int = 0  # Elf32_Word
+    sh_addralign: int = 0  # Elf32_Word
+    sh_entsize: int = 0  # Elf32_Word
+
+
+class Elf32_Shdr_BE(Elf32_Shdr):
+    _endian_ = ">"
+
+
+class Elf32_Shdr_LE(Elf32_Shdr):
+    _endian_ = "<"
 
 
-class Elf64_Shdr_BE(Structure):
+@dataclass
+class Elf64_Shdr(ElfRecord):
+    _format_ = "IIQQQQIIQQ"
+
+    sh_name: int = 0  # Elf64_Word
+    sh_type: int = 0  # Elf64_Word
+    sh_flags: int = 0  # Elf64_Xword
+    sh_addr: int = 0  # Elf64_Addr
+    sh_offset: int = 0  # Elf64_Off
+    sh_size: int = 0  # Elf64_Xword
+    sh_link: int = 0  # Elf64_Word
+    sh_info: int = 0  # Elf64_Word
+    sh_addralign: int = 0  # Elf64_Xword
+    sh_entsize: int = 0  # Elf64_Xword
+
+
+class Elf64_Shdr_BE(Elf64_Shdr):
     _endian_ = ">"
-    _fields_ = _Elf64_Shdr_fields
 
 
-class Elf64_Shdr_LE(Structure):
+class Elf64_Shdr_LE(Elf64_Shdr):
     _endian_ = "<"
-    _fields_ = _Elf64_Shdr_fields
 
 
-_Elf32_Dyn_fields = [
-    ("d_tag", Elf32_Sword),
-    ("d_ptr_or_val", Elf32_Addr),  # union of d_ptr and d_val
-]
+@dataclass
+class Elf32_Dyn(ElfRecord):
+    _format_ = "iI"
+
+    d_tag: int = 0  # Elf32_Sword
+    d_ptr_or_val: int = 0  # Elf32_Addr; union of d_ptr and d_val
 
 
-class Elf32_Dyn_BE(Structure):
+class Elf32_Dyn_BE(Elf32_Dyn):
     _endian_ = ">"
-    _fields_ = _Elf32_Dyn_fields
 
 
-class Elf32_Dyn_LE(Structure):
+class Elf32_Dyn_LE(Elf32_Dyn):
     _endian_ = "<"
-    _fields_ = _Elf32_Dyn_fields
 
 
-_Elf64_Dyn_fields = [
-    ("d_tag", Elf64_Sxword),
-    ("d_ptr_or_val", Elf64_Addr),  # union of d_ptr and d_val
-]
+@dataclass
+class Elf64_Dyn(ElfRecord):
+    _format_ = "qQ"
+
+    d_tag: int = 0  # Elf64_Sxword
+    d_ptr_or_val: int = 0  # Elf64_Addr; union of d_ptr and d_val
 
 
-class Elf64_Dyn_BE(Structure):
+class Elf64_Dyn_BE(Elf64_Dyn):
     _endian_ = ">"
-    _fields_ = _Elf64_Dyn_fields
 
 
-class Elf64_Dyn_LE(Structure):
+class Elf64_Dyn_LE(Elf64_Dyn):
     _endian_ = "<"
-    _fields_ = _Elf64_Dyn_fields
 
 
-_Elf32_Sym_fields = [
-    ("st_name", Elf32_Word),
-    ("st_value", Elf32_Addr),
-    ("st_size", Elf32_Word),
-    ("st_info", p_uint8),
-    ("st_other", p_uint8),
-    ("st_shndx", Elf32_Half),
-]
+@dataclass
+class Elf32_Sym(ElfRecord):
+    _format_ = "IIIBBH"
+
+    st_name: int = 0  # Elf32_Word
+    st_value: int = 0  # Elf32_Addr
+    st_size: int = 0  # Elf32_Word
+    st_info: int = 0  # unsigned char
+    st_other: int = 0  # unsigned char
+    st_shndx: int = 0  # Elf32_Half
 
 
-class Elf32_Sym_BE(Structure):
+class Elf32_Sym_BE(Elf32_Sym):
     _endian_ = ">"
-    _fields_ = _Elf32_Sym_fields
 
 
-class Elf32_Sym_LE(Structure):
+class Elf32_Sym_LE(Elf32_Sym):
     _endian_ = "<"
-    _fields_ = _Elf32_Sym_fields
 
 
-_Elf64_Sym_fields = [
-    ("st_name", Elf64_Word),
-    ("st_info", p_uint8),
-    ("st_other", p_uint8),
-    ("st_shndx", Elf64_Half),
-    ("st_value", Elf64_Addr),
-    ("st_size", Elf64_Xword),
-]
+@dataclass
+class Elf64_Sym(ElfRecord):
+    _format_ = "IBBHQQ"
 
+    st_name: int = 0  # Elf64_Word
+    st_info: int = 0  # unsigned char
+    st_other: int = 0  # unsigned char
+    st_shndx: int = 0  # Elf64_Half
+    st_value: int = 0  # Elf64_Addr
+    st_size: int = 0  # Elf64_Xword
 
-class Elf64_Sym_BE(Structure):
+
+class Elf64_Sym_BE(Elf64_Sym):
     _endian_ = ">"
-    _fields_ = _Elf64_Sym_fields
 
 
-class Elf64_Sym_LE(Structure):
+class Elf64_Sym_LE(Elf64_Sym):
     _endian_ = "<"
-    _fields_ = _Elf64_Sym_fields
 
 
-_Elf32_Verneed_fields = [
-    ("vn_version", Elf32_Half),
-    ("vn_cnt", Elf32_Half),
-    ("vn_file", Elf32_Word),
-    ("vn_aux", Elf32_Word),
-    ("vn_next", Elf32_Word),
-]
+@dataclass
+class Elf32_Verneed(ElfRecord):
+    _format_ = "HHIII"
+
+    vn_version: int = 0  # Elf32_Half
+    vn_cnt: int = 0  # Elf32_Half
+    vn_file: int = 0  # Elf32_Word
+    vn_aux: int = 0  # Elf32_Word
+    vn_next: int = 0  # Elf32_Word
 
 
-class Elf32_Verneed_BE(Structure):
+class Elf32_Verneed_BE(Elf32_Verneed):
     _endian_ = ">"
-    _fields_ = _Elf32_Verneed_fields
 
 
-class Elf32_Verneed_LE(Structure):
+class Elf32_Verneed_LE(Elf32_Verneed):
     _endian_ = "<"
-    _fields_ = _Elf32_Verneed_fields
 
 
-_Elf64_Verneed_fields = [
-    ("vn_version", Elf64_Half),
-    ("vn_cnt", Elf64_Half),
-    ("vn_file", Elf64_Word),
-    ("vn_aux", Elf64_Word),
-    ("vn_next", Elf64_Word),
-]
+@dataclass
+class Elf64_Verneed(ElfRecord):
+    _format_ = "HHIII"
 
+    vn_version: int = 0  # Elf64_Half
+    vn_cnt: int = 0  # Elf64_Half
+    vn_file: int = 0  # Elf64_Word
+    vn_aux: int = 0  # Elf64_Word
+    vn_next: int = 0  # Elf64_Word
 
-class Elf64_Verneed_BE(Structure):
+
+class Elf64_Verneed_BE(Elf64_Verneed):
     _endian_ = ">"
-    _fields_ = _Elf64_Verneed_fields
 
 
-class Elf64_Verneed_LE(Structure):
+class Elf64_Verneed_LE(Elf64_Verneed):
     _endian_ = "<"
-    _fields_ = _Elf64_Verneed_fields
 
 
-_Elf32_Vernaux_fields = [
-    ("vna_hash", Elf32_Word),
-    ("vna_flags", Elf32_Half),
-    ("vna_other", Elf32_Half),
-    ("vna_name", Elf32_Word),
-    ("vna_next", Elf32_Word),
-]
+@dataclass
+class Elf32_Vernaux(ElfRecord):
+    _format_ = "IHHII"
+
+    vna_hash: int = 0  # Elf32_Word
+    vna_flags: int = 0  # Elf32_Half
+    vna_other: int = 0  # Elf32_Half
+    vna_name: int = 0  # Elf32_Word
+    vna_next: int = 0  # Elf32_Word
 
 
-class Elf32_Vernaux_BE(Structure):
+class Elf32_Vernaux_BE(Elf32_Vernaux):
     _endian_ = ">"
-    _fields_ = _Elf32_Vernaux_fields
 
 
-class Elf32_Vernaux_LE(Structure):
+class Elf32_Vernaux_LE(Elf32_Vernaux):
     _endian_ = "<"
-    _fields_ = _Elf32_Vernaux_fields
 
 
-_Elf64_Vernaux_fields = [
-    ("vna_hash", Elf64_Word),
-    ("vna_flags", Elf64_Half),
-    ("vna_other", Elf64_Half),
-    ("vna_name", Elf64_Word),
-    ("vna_next", Elf64_Word),
-]
+@dataclass
+class Elf64_Vernaux(ElfRecord):
+    _format_ = "IHHII"
+
+    vna_hash: int = 0  # Elf64_Word
+    vna_flags: int = 0  # Elf64_Half
+    vna_other: int = 0  # Elf64_Half
+    vna_name: int = 0  # Elf64_Word
+    vna_next: int = 0  # Elf64_Word
 
 
-class Elf64_Vernaux_BE(Structure):
+class Elf64_Vernaux_BE(Elf64_Vernaux):
     _endian_ = ">"
-    _fields_ = _Elf64_Vernaux_fields
 
 
-class Elf64_Vernaux_LE(Structure):
+class Elf64_Vernaux_LE(Elf64_Vernaux):
     _endian_ = "<"
-    _fields_ = _Elf64_Vernaux_fields
 
 
 Elf_Ehdr = Union[Elf32_Ehdr_BE, Elf32_Ehdr_LE, Elf64_Ehdr_BE, Elf64_Ehdr_LE]
@@ -424,9 +446,25 @@ class ElfClass:
     Verneed: Elf_Verneed
     Vernaux: Elf_Vernaux
 
+    # Record sizes, which are needed often enough while parsing and writing to be worth keeping at hand.
+    phdr_size: int = field(init=False)
+    shdr_size: int = field(init=False)
+    dyn_size: int = field(init=False)
+    sym_size: int = field(init=False)
+    verneed_size: int = field(init=False)
+    vernaux_size: int = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.phdr_size = self.Phdr.size
+        self.shdr_size = self.Shdr.size
+        self.dyn_size = self.Dyn.size
+        self.sym_size = self.Sym.size
+        self.verneed_size = self.Verneed.size
+        self.vernaux_size = self.Vernaux.size
+
 
 ELF32_CLASS_BE = ElfClass(
-    alignment=sizeof(Elf32_Off),
+    alignment=4,  # sizeof(Elf32_Off)
     Ehdr=Elf32_Ehdr_BE,
     Phdr=Elf32_Phdr_BE,
     Shdr=Elf32_Shdr_BE,
@@ -437,7 +475,7 @@ ELF32_CLASS_BE = ElfClass(
 )
 
 ELF32_CLASS_LE = ElfClass(
-    alignment=sizeof(Elf32_Off),
+    alignment=4,  # sizeof(Elf32_Off)
     Ehdr=Elf32_Ehdr_LE,
     Phdr=Elf32_Phdr_LE,
     Shdr=Elf32_Shdr_LE,
@@ -448,7 +486,7 @@ ELF32_CLASS_LE = ElfClass(
 )
 
 ELF64_CLASS_BE = ElfClass(
-    alignment=sizeof(Elf64_Off),
+    alignment=8,  # sizeof(Elf64_Off)
     Ehdr=Elf64_Ehdr_BE,
     Phdr=Elf64_Phdr_BE,
     Shdr=Elf64_Shdr_BE,
@@ -459,7 +497,7 @@ ELF64_CLASS_BE = ElfClass(
 )
 
 ELF64_CLASS_LE = ElfClass(
-    alignment=sizeof(Elf64_Off),
+    alignment=8,  # sizeof(Elf64_Off)
     Ehdr=Elf64_Ehdr_LE,
     Phdr=Elf64_Phdr_LE,
     Shdr=Elf64_Shdr_LE,
@@ -469,6 +507,13 @@ ELF64_CLASS_LE = ElfClass(
     Vernaux=Elf64_Vernaux_LE,
 )
 
+ELF_CLASSES = {
+    (ELFCLASS32, ELFDATA2MSB): ELF32_CLASS_BE,
+    (ELFCLASS32, ELFDATA2LSB): ELF32_CLASS_LE,
+    (ELFCLASS64, ELFDATA2MSB): ELF64_CLASS_BE,
+    (ELFCLASS64, ELFDATA2LSB): ELF64_CLASS_LE,
+}
+
 
 @dataclass
 class VerneedEntry:
@@ -487,6 +532,8 @@ class SectionInfo:
 
 
 class PositionTracker:
+    __slots__ = ("file_offset", "file_start", "max_file_offset", "max_vm_offset", "vm_offset", "vm_start")
+
     def __init__(self, file_offset: int, vm_offset: int):
         self.file_start = file_offset
         self.vm_start = vm_offset
@@ -496,10 +543,15 @@ class PositionTracker:
         self.max_vm_offset = vm_offset
 
     def add(self, count: int) -> None:
-        self.file_offset += count
-        self.max_file_offset = max(self.file_offset, self.max_file_offset)
-        self.vm_offset += count
-        self.max_vm_offset = max(self.vm_offset, self.max_vm_offset)
+        # Called for every record written, so this avoids the max() calls used elsewhere.
+        file_offset = self.file_offset + count
+        self.file_offset = file_offset
+        if file_offset > self.max_file_offset:
+            self.max_file_offset = file_offset
+        vm_offset = self.vm_offset + count
+        self.vm_offset = vm_offset
+        if vm_offset > self.max_vm_offset:
+            self.max_vm_offset = vm_offset
 
     def round(self, align: int) -> None:
         if not align:
@@ -541,21 +593,31 @@ class ElfFile:
     def __init__(self, fh: BinaryIO):
         self._fh = fh
 
-        ident = self.ident
-        self.elf_class = ident.ei_class
+        try:
+            ident = self.ident
+            self.elf_class = ident.ei_class
+
+            if ident.ei_class not in (ELFCLASS32, ELFCLASS64):
+                raise ValueError(f"Unknown ei_class value: {ident.ei_class}")
+
+            if ident.ei_data not in (ELFDATA2MSB, ELFDATA2LSB):
+                raise ValueError(f"Unknown ei_data value: {ident.ei_data}")
+
+            self._class = ELF_CLASSES[(ident.ei_class, ident.ei_data)]
+        except BaseException:
+            # The caller never gets an object to close, so don't leave the file mapped.
+            self._release_data()
+            raise
 
-        if ident.ei_class not in (ELFCLASS32, ELFCLASS64):
-            raise ValueError(f"Unknown ei_class value: {ident.ei_class}")
+    def __enter__(self) -> "ElfFile":
+        return self
 
-        if ident.ei_data not in (ELFDATA2MSB, ELFDATA2LSB):
-            raise ValueError(f"Unknown ei_data value: {ident.ei_data}")
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
 
-        self._class = {
-            (ELFCLASS32, ELFDATA2MSB): ELF32_CLASS_BE,
-            (ELFCLASS32, ELFDATA2LSB): ELF32_CLASS_LE,
-            (ELFCLASS64, ELFDATA2MSB): ELF64_CLASS_BE,
-            (ELFCLASS64, ELFDATA2LSB): ELF64_CLASS_LE,
-        }[(ident.ei_class, ident.ei_data)]
+    def close(self) -> None:
+        """Releases the file mapping. The file handle belongs to the caller and is left open."""
+        self._release_data()
 
     @contextmanager
     def _peek(self) -> Generator[BinaryIO, None, None]:
@@ -566,142 +628,143 @@ class ElfFile:
         finally:
             self._fh.seek(pos)
 
+    def _release_data(self) -> None:
+        # Unmaps the file. This must happen before writing since a mapping has a fixed length, and because
+        # Windows won't truncate a file that's mapped.
+        data = self.__dict__.pop("_data", None)
+        if isinstance(data, mmap.mmap):
+            data.close()
+
     def _clear_read_cache(self) -> None:
+        self._release_data()
         # Deletes all of the @cached_property values.
-        for k, v in self.__class__.__dict__.items():
-            if v.__class__.__name__ == "cached_property":
-                try:
-                    delattr(self, k)
-                except AttributeError:
-                    pass
+        for k in self._cached_properties:
+            self.__dict__.pop(k, None)
+
+    @cached_property
+    def _data(self) -> Union[mmap.mmap, bytes]:
+        """The file's contents, which the read-only properties parse from.
+
+        Memory mapped when possible, so parsing doesn't need a seek and read for every structure.
+        """
+        self._fh.flush()
+        try:
+            return mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # No file descriptor (e.g. BytesIO), or an empty file, which can't be mapped.
+            with self._peek() as fh:
+                fh.seek(0)
+                return fh.read()
 
     @cached_property
     def ident(self) -> ElfIdent:
-        with self._peek() as fh:
-            fh.seek(0)
-            ident = ElfIdent.from_fileobj(fh)
-        if (ident.ei_mag0, ident.ei_mag1, ident.ei_mag2, ident.ei_mag3) != ELF_MAGIC:
+        if self._data[: len(ELF_MAGIC)] != ELF_MAGIC:
             raise ValueError("Not an ELF file")
-        return ident
+        return unpack_structure(self._data, 0, ElfIdent_LE)
 
     @cached_property
     def ehdr(self) -> Elf_Ehdr:
-        with self._peek() as fh:
-            fh.seek(0)
-            return self._class.Ehdr.from_fileobj(fh)
+        return unpack_structure(self._data, 0, self._class.Ehdr)
 
     @cached_property
     def phdrs(self) -> List[Elf_Phdr]:
         h = self.ehdr
         # Sanity check header size
-        if h.e_phentsize != sizeof(self._class.Phdr):
-            raise ValueError(f"ELF Phdr entry size ({h.e_phentsize}) doesn't match expected ({sizeof(self._class.Phdr)})")
+        if h.e_phentsize != self._class.phdr_size:
+            raise ValueError(f"ELF Phdr entry size ({h.e_phentsize}) doesn't match expected ({self._class.phdr_size})")
 
         if not h.e_phoff:
             return []
 
-        result = []
-        entry_count = h.e_phnum
-        with self._peek() as fh:
-            fh.seek(h.e_phoff)
-
-            for _ in range(entry_count):
-                result.append(self._class.Phdr.from_fileobj(fh))
-
-        return result
+        return unpack_structures(self._data, h.e_phoff, self._class.Phdr, h.e_phnum)
 
     @cached_property
     def shdrs(self) -> List[Elf_Shdr]:
         h = self.ehdr
 
         # Sanity check header size
-        if h.e_shentsize != sizeof(self._class.Shdr):
-            raise ValueError(f"ELF Shdr entry size ({h.e_shentsize}) doesn't match expected ({sizeof(self._class.Shdr)})")
+        if h.e_shentsize != self._class.shdr_size:
+            raise ValueError(f"ELF Shdr entry size ({h.e_shentsize}) doesn't match expected ({self._class.shdr_size})")
 
         if not h.e_shoff:
             return []
 
-        result = []
         entry_count = h.e_shnum
-        with self._peek() as fh:
-            fh.seek(h.e_shoff)
+        if not entry_count:
+            # If the number of sections is greater than or equal to SHN_LORESERVE (0xff00),
+            # e_shnum has the value zero. The actual number of section header table entries
+            # is contained in the sh_size field of the section header at index 0. Otherwise,
+            # the sh_size member of the initial section header entry contains the value zero.
+            entry_count = unpack_structure(self._data, h.e_shoff, self._class.Shdr).sh_size
 
-            if not entry_count:
-                # If the number of sections is greater than or equal to SHN_LORESERVE (0xff00),
-                # e_shnum has the value zero. The actual number of section header table entries
-                # is contained in the sh_size field of the section header at index 0. Otherwise,
-                # the sh_size member of the initial section header entry contains the value zero.
-                first_entry = self._class.Shdr.from_fileobj(fh)
-                entry_count = first_entry.sh_size - 1  # We already read the first entry
-                result.append(first_entry)
-
-            for _ in range(entry_count):
-                result.append(self._class.Shdr.from_fileobj(fh))
-
-        return result
+        return unpack_structures(self._data, h.e_shoff, self._class.Shdr, entry_count)
 
     @cached_property
     def shdr_names(self) -> List[bytes]:
         ehdr = self.ehdr
         shdrs = self.shdrs
-        strtab_off = shdrs[ehdr.e_shstrndx].sh_offset
-        result = []
-        with self._peek() as fh:
-            for shdr in shdrs:
-                name_pos = strtab_off + shdr.sh_name
-                fh.seek(name_pos)
-                result.append(read_c_str(fh))
+        strtab_shdr = shdrs[ehdr.e_shstrndx]
+        strtab = self._data[strtab_shdr.sh_offset : strtab_shdr.sh_offset + strtab_shdr.sh_size]
+        return [get_strtab_entry(strtab, shdr.sh_name) for shdr in shdrs]
 
+    @cached_property
+    def shdr_index_by_name(self) -> Dict[bytes, int]:
+        result: Dict[bytes, int] = {}
+        for i, shdr_name in enumerate(self.shdr_names):
+            # The first section wins if a name appears more than once.
+            result.setdefault(shdr_name, i)
         return result
 
     @cached_property
-    def dyn(self) -> List[Elf_Dyn]:
+    def shdrs_by_type(self) -> Dict[int, List[Elf_Shdr]]:
+        result: Dict[int, List[Elf_Shdr]] = {}
         for shdr in self.shdrs:
-            if shdr.sh_type == SHT_DYNAMIC:
-                dyn_pos = shdr.sh_offset
-                break
-        else:
+            result.setdefault(shdr.sh_type, []).append(shdr)
+        return result
+
+    @cached_property
+    def dyn(self) -> List[Elf_Dyn]:
+        dynamic_shdrs = self.shdrs_by_type.get(SHT_DYNAMIC)
+        if not dynamic_shdrs:
             return []  # No dynamic section?
+        shdr = dynamic_shdrs[0]
 
-        result = []
-        with self._peek() as fh:
-            fh.seek(dyn_pos)
-            while True:
-                next = self._class.Dyn.from_fileobj(fh)
-                result.append(next)
-                if next.d_tag == DT_NULL:
-                    break
+        # Unpack the whole section at once, then keep everything up to and including DT_NULL.
+        entries = unpack_structures(self._data, shdr.sh_offset, self._class.Dyn, shdr.sh_size // self._class.dyn_size)
+        for i, d in enumerate(entries):
+            if d.d_tag == DT_NULL:
+                return entries[: i + 1]
 
+        raise ValueError("Dynamic section has no DT_NULL entry")
+
+    @cached_property
+    def dyn_by_tag(self) -> Dict[int, List[Elf_Dyn]]:
+        result: Dict[int, List[Elf_Dyn]] = {}
+        for d in self.dyn:
+            result.setdefault(d.d_tag, []).append(d)
         return result
 
+    def _get_dyn_value(self, tag: int, default: Optional[int] = None) -> Optional[int]:
+        """Returns the value of the last dynamic entry with the given tag."""
+        entries = self.dyn_by_tag.get(tag)
+        return entries[-1].d_ptr_or_val if entries else default
+
     @cached_property
     def dynstr(self) -> bytes:
         # Find dynstr
-        dynstr_pos = -1
-        dynstr_size = -1
-        for d in self.dyn:
-            if d.d_tag == DT_STRTAB:
-                dynstr_pos = d.d_ptr_or_val
-            elif d.d_tag == DT_STRSZ:
-                dynstr_size = d.d_ptr_or_val
+        dynstr_pos = self._get_dyn_value(DT_STRTAB, -1)
+        dynstr_size = self._get_dyn_value(DT_STRSZ, -1)
 
         # Sanity check to make sure the .dynstr section agrees with DT_STRTAB and DT_STRSZ.
         dynstr_shdr = self.get_shdr(b".dynstr")
         if dynstr_pos != dynstr_shdr.sh_addr or dynstr_size != dynstr_shdr.sh_size:
             raise ValueError("DT_STRTAB and DT_STRSZ do not agree with .dynstr")
 
-        with self._peek() as fh:
-            fh.seek(dynstr_shdr.sh_offset)
-            dynstr = fh.read(dynstr_shdr.sh_size)
-
-        return dynstr
+        return self._data[dynstr_shdr.sh_offset : dynstr_shdr.sh_offset + dynstr_shdr.sh_size]
 
     @cached_property
     def verneed_entries(self) -> List[VerneedEntry]:
-        verneed_num = None
-        for d in self.dyn:
-            if d.d_tag == DT_VERNEEDNUM:
-                verneed_num = d.d_ptr_or_val
+        verneed_num = self._get_dyn_value(DT_VERNEEDNUM)
 
         result = []
         verneed_shdr = self.find_shdr(b".gnu.version_r")
@@ -709,55 +772,42 @@ class ElfFile:
             verneed_pos = verneed_shdr.sh_offset
             # We get the string table index from the corresponding verneed section's sh_link
             verneed_strtab_shdr = self.shdrs[verneed_shdr.sh_link]
-            with self._peek() as fh:
-                fh.seek(verneed_strtab_shdr.sh_offset)
-                vn_strtab = fh.read(verneed_strtab_shdr.sh_size)
-                while verneed_num:
-                    fh.seek(verneed_pos)
-                    cur_need = self._class.Verneed.from_fileobj(fh)
-                    cur_need_name = get_strtab_entry(vn_strtab, cur_need.vn_file)
-                    aux = []
-                    aux_names = []
-                    aux_count = cur_need.vn_cnt
-                    aux_pos = verneed_pos + cur_need.vn_aux
-                    while aux_count:
-                        fh.seek(aux_pos)
-                        cur_aux = self._class.Vernaux.from_fileobj(fh)
-                        cur_aux_name = get_strtab_entry(vn_strtab, cur_aux.vna_name)
-                        aux_pos += cur_aux.vna_next
-                        aux_count -= 1
-                        aux.append(cur_aux)
-                        aux_names.append(cur_aux_name)
-
-                    result.append(
-                        VerneedEntry(verneed=cur_need, vernaux=aux, verneed_name=cur_need_name, vernaux_names=aux_names)
-                    )
-                    verneed_pos += cur_need.vn_next
-                    verneed_num -= 1
+            data = self._data
+            vn_strtab = data[verneed_strtab_shdr.sh_offset : verneed_strtab_shdr.sh_offset + verneed_strtab_shdr.sh_size]
+            while verneed_num:
+                cur_need = unpack_structure(data, verneed_pos, self._class.Verneed)
+                cur_need_name = get_strtab_entry(vn_strtab, cur_need.vn_file)
+                aux = []
+                aux_names = []
+                aux_count = cur_need.vn_cnt
+                aux_pos = verneed_pos + cur_need.vn_aux
+                while aux_count:
+                    cur_aux = unpack_structure(data, aux_pos, self._class.Vernaux)
+                    cur_aux_name = get_strtab_entry(vn_strtab, cur_aux.vna_name)
+                    aux_pos += cur_aux.vna_next
+                    aux_count -= 1
+                    aux.append(cur_aux)
+                    aux_names.append(cur_aux_name)
+
+                result.append(VerneedEntry(verneed=cur_need, vernaux=aux, verneed_name=cur_need_name, vernaux_names=aux_names))
+                verneed_pos += cur_need.vn_next
+                verneed_num -= 1
 
         return result
 
     @cached_property
     def rpath(self) -> Optional[str]:
-        for d in self.dyn:
-            if d.d_tag == DT_RPATH:
-                return get_strtab_entry(self.dynstr, d.d_ptr_or_val)
-        return None
+        entries = self.dyn_by_tag.get(DT_RPATH)
+        return get_strtab_entry(self.dynstr, entries[0].d_ptr_or_val) if entries else None
 
     @cached_property
     def runpath(self) -> Optional[bytes]:
-        for d in self.dyn:
-            if d.d_tag == DT_RUNPATH:
-                return get_strtab_entry(self.dynstr, d.d_ptr_or_val)
-        return None
+        entries = self.dyn_by_tag.get(DT_RUNPATH)
+        return get_strtab_entry(self.dynstr, entries[0].d_ptr_or_val) if entries else None
 
     def guess_page_size(self) -> int:
         """Guess the page size from existing PT_LOAD headers. Else default to 0x1000."""
-        page_size = 0
-
-        for phdr in self.phdrs:
-            if phdr.p_type == PT_LOAD:
-                page_size = max(page_size, phdr.p_align)
+        page_size = max((phdr.p_align for phdr in self.phdrs if phdr.p_type == PT_LOAD), default=0)
 
         # Default to 0x1000
         return page_size or 0x1000
@@ -783,24 +833,24 @@ class ElfFile:
         buf.seek(pos.buf_offset)
         buf_start = buf.tell()
         for vn_index, vn in enumerate(verneed_entries):
-            vn_struct = copy.deepcopy(vn.verneed)  # copy because we're going to modify it.
+            vn_struct = copy.copy(vn.verneed)  # copy because we're going to modify it.
             new_name = needed_replacements.get(vn.verneed_name, vn.verneed_name)
             vn_struct.vn_file = dynstr.needed_pos[new_name]
             if vn.vernaux:
-                vn_struct.vn_aux = sizeof(self._class.Verneed)
+                vn_struct.vn_aux = self._class.verneed_size
             else:
                 vn_struct.vn_aux = 0
             if vn_index < len(verneed_entries) - 1:
-                vn_struct.vn_next = sizeof(self._class.Verneed) + sizeof(self._class.Vernaux) * len(vn.vernaux)
+                vn_struct.vn_next = self._class.verneed_size + self._class.vernaux_size * len(vn.vernaux)
             else:
                 vn_struct.vn_next = 0
             vn_struct.to_fileobj(buf)
 
             for vna_index, (vna_struct, vna_name) in enumerate(zip(vn.vernaux, vn.vernaux_names)):
-                vna_struct = copy.deepcopy(vna_struct)
+                vna_struct = copy.copy(vna_struct)
                 vna_struct.vna_name = dynstr.vernaux_pos[vna_name]
                 if vna_index < len(vn.vernaux) - 1:
-                    vna_struct.vna_next = sizeof(self._class.Vernaux)
+                    vna_struct.vna_next = self._class.vernaux_size
                 else:
                     vna_struct.vna_next = 0
                 vna_struct.to_fileobj(buf)
@@ -910,10 +960,10 @@ class ElfFile:
         buf.seek(pos.buf_offset)
         buf_start = buf.tell()
 
-        dynstr_index = self.shdr_names.index(b".dynstr")  # We'll use this for sh_link in .dynamic and .gnu.version_r
+        dynstr_index = self.shdr_index_by_name[b".dynstr"]  # We'll use this for sh_link in .dynamic and .gnu.version_r
 
         for shdr, shdr_name in zip(self.shdrs, self.shdr_names):
-            shdr = copy.deepcopy(shdr)
+            shdr = copy.copy(shdr)
             if shdr_name == b".dynstr":
                 shdr.sh_addr = dynstr_pos.vm_offset
                 shdr.sh_offset = dynstr_pos.file_offset
@@ -958,7 +1008,7 @@ class ElfFile:
                 # Remember the position of this header because we might overwrite it.
                 last_load_pos = buf.tell()
 
-            phdr = copy.deepcopy(phdr)
+            phdr = copy.copy(phdr)
             if phdr.p_type == PT_DYNAMIC:
                 phdr.p_offset = dynamic_pos.file_offset
                 phdr.p_vaddr = dynamic_pos.vm_offset
@@ -966,7 +1016,7 @@ class ElfFile:
                 phdr.p_filesz = dynamic_pos.length
                 phdr.p_memsz = dynamic_pos.length
             elif phdr.p_type == PT_PHDR:
-                phdr_size = sizeof(self._class.Phdr) * phdr_count
+                phdr_size = self._class.phdr_size * phdr_count
                 phdr.p_offset = phdr_file_offset
                 phdr.p_vaddr = phdr_vm_offset
                 phdr.p_paddr = phdr_vm_offset
@@ -981,8 +1031,8 @@ class ElfFile:
         orig_buf_pos = None
         if add_new_load:
             # Update our position and length to account for a new PT_LOAD segment.
-            pos.add(sizeof(self._class.Phdr))
-            written_len += sizeof(self._class.Phdr)
+            pos.add(self._class.phdr_size)
+            written_len += self._class.phdr_size
         else:
             # Else, if we're overwriting an existing PT_LOAD, seek to its position.
             orig_buf_pos = buf.tell()
@@ -1032,8 +1082,11 @@ class ElfFile:
             elif d.d_tag == DT_RUNPATH:
                 cur_runpath = get_strtab_entry(self.dynstr, d.d_ptr_or_val)
 
-        cur_verneed_names = [ve.verneed_name for ve in self.verneed_entries]
-        all_verneed_versions = {aux for ve in self.verneed_entries for aux in ve.vernaux_names}
+        cur_verneed_names = []
+        all_verneed_versions = set()
+        for ve in self.verneed_entries:
+            cur_verneed_names.append(ve.verneed_name)
+            all_verneed_versions.update(ve.vernaux_names)
 
         # Unpatched binaries might have runpath, which takes precedence over rpath.
         # After patching, we'll have removed the runpath.
@@ -1052,17 +1105,20 @@ class ElfFile:
         # We expect .dynstr to end with a substring starting with $PATCH$\0,
         # followed by our SONAME, RPATH, and needed paths (shared between
         # DT_NEEDED and DT_VERNEED). If not, we just append to .dynstr and leave
-        # everything else.
-        expected_dynstr_suffix = build_dynstr(
-            cur_soname, cur_rpath, set(cur_needed_names + cur_verneed_names), all_verneed_versions
-        )
-
-        # See if .dynstr ends with what we expect. If there's stuff before our prefix, we expect
-        # a null byte that follows the last existing entry.
-        if self.dynstr == expected_dynstr_suffix.strtab or self.dynstr.endswith(b"\0" + expected_dynstr_suffix.strtab):
-            new_dynstr_prefix = self.dynstr[: -len(expected_dynstr_suffix.strtab)]
-        else:
-            new_dynstr_prefix = self.dynstr
+        # everything else. A .dynstr without $PATCH$ has never been patched, so there's no suffix to build.
+        new_dynstr_prefix = self.dynstr
+        if b"$PATCH$\0" in self.dynstr:
+            expected_dynstr_suffix = build_dynstr(
+                cur_soname, cur_rpath, set(cur_needed_names + cur_verneed_names), all_verneed_versions
+            )
+
+            # See if .dynstr ends with what we expect. If there's stuff before our prefix, we expect
+            # a null byte that follows the last existing entry.
+            suffix_start = len(self.dynstr) - len(expected_dynstr_suffix.strtab)
+            if self.dynstr.endswith(expected_dynstr_suffix.strtab) and (
+                suffix_start == 0 or self.dynstr[suffix_start - 1] == 0
+            ):
+                new_dynstr_prefix = self.dynstr[:suffix_start]
 
         # Construct the new .dynstr on top of whatever prefix we determined.
         new_dynstr = build_dynstr(
@@ -1111,19 +1167,30 @@ class ElfFile:
         with self._peek() as fh:
             fh.seek(strtab_shdr.sh_offset)
             st_strtab = fh.read(strtab_shdr.sh_size)
-            count = symtab_shdr.sh_size // sizeof(self._class.Sym)
-            for i in range(count):
-                pos = symtab_shdr.sh_offset + i * sizeof(self._class.Sym)
-                fh.seek(pos)
-                entry = self._class.Sym.from_fileobj(fh)
-                if entry.st_name != 0:
-                    name = get_strtab_entry(st_strtab, entry.st_name)
-                    if name == b"_DYNAMIC":
-                        entry = copy.deepcopy(entry)
-                        entry.st_value = dynamic_pos.vm_offset
-                        fh.seek(pos)
-                        entry.to_fileobj(fh)
-                        return
+            # Find the string table offsets that name _DYNAMIC first, so that symbols can be matched on
+            # st_name alone. The name can appear more than once, including as the tail of a longer name.
+            name_offsets = set()
+            name_pos = st_strtab.find(b"_DYNAMIC\0")
+            while name_pos >= 0:
+                name_offsets.add(name_pos)
+                name_pos = st_strtab.find(b"_DYNAMIC\0", name_pos + 1)
+            if not name_offsets:
+                return
+
+            # Read the whole table at once rather than seeking to and reading each symbol.
+            fh.seek(symtab_shdr.sh_offset)
+            symtab = fh.read(symtab_shdr.sh_size)
+            # Scan the raw tuples and only build a record for the symbol we're after. st_name comes
+            # first in both the 32- and 64-bit layouts.
+            sym_cls = self._class.Sym
+            count = symtab_shdr.sh_size // self._class.sym_size
+            for i, values in enumerate(sym_cls._struct_.iter_unpack(symtab[: count * self._class.sym_size])):
+                if values[0] in name_offsets:
+                    entry = sym_cls.from_tuple(values)
+                    entry.st_value = dynamic_pos.vm_offset
+                    fh.seek(symtab_shdr.sh_offset + i * self._class.sym_size)
+                    entry.to_fileobj(fh)
+                    return
 
     def get_shdr(self, name: bytes) -> Elf_Shdr:
         s = self.find_shdr(name)
@@ -1133,29 +1200,17 @@ class ElfFile:
 
     def find_shdr(self, name: bytes) -> Optional[Elf_Shdr]:
         assert isinstance(name, bytes), "expected name to be of type bytes"
-        for shdr, shdr_name in zip(self.shdrs, self.shdr_names):
-            if shdr_name == name:
-                return shdr
-        return None
+        index = self.shdr_index_by_name.get(name)
+        return None if index is None else self.shdrs[index]
 
     def _get_last_load_segment(self) -> Optional[Elf_Phdr]:
-        last_load = None
-        for phdr in self.phdrs:
-            if phdr.p_type == PT_LOAD:
-                if last_load is None or phdr.p_offset > last_load.p_offset:
-                    last_load = phdr
-        return last_load
+        return max((phdr for phdr in self.phdrs if phdr.p_type == PT_LOAD), key=lambda phdr: phdr.p_offset, default=None)
 
     def _can_overwrite_last_load(self, last_load_header: Elf_Phdr) -> bool:
-        with self._peek() as fh:
-            fh.seek(last_load_header.p_offset)
-            last_load_data = fh.read(last_load_header.p_filesz)
-            read_end = fh.tell()
-            fh.seek(0, io.SEEK_END)
-            file_end = fh.tell()
+        data = self._data
 
         # Return false if this isn't the last data in the file
-        if read_end != file_end:
+        if last_load_header.p_offset + last_load_header.p_filesz != len(data):
             return False
 
         # Generate the LOAD segment that we'd expect with the current values, and
@@ -1167,7 +1222,33 @@ class ElfFile:
             vm_offset=last_load_header.p_vaddr,
             add_new_load=False,
         )
-        return new_load_data.getvalue() == last_load_data
+        with new_load_data.getbuffer() as expected:
+            # Checking the size first avoids copying the segment out of the file when it can't match.
+            if len(expected) != last_load_header.p_filesz:
+                return False
+            return expected == data[last_load_header.p_offset :]
+
+    def _rewrite_is_noop(
+        self, new_soname: Optional[bytes], new_rpath: Optional[bytes], needed_replacements: Dict[bytes, bytes]
+    ) -> bool:
+        """Returns True if a rewrite with these values wouldn't change anything the dynamic loader sees."""
+        if DT_RUNPATH in self.dyn_by_tag:
+            # A rewrite always replaces DT_RUNPATH with DT_RPATH.
+            return False
+
+        # Like _write_new_trailer, use the last entry if a tag appears more than once.
+        def cur_value(tag: int) -> bytes:
+            entries = self.dyn_by_tag.get(tag)
+            return get_strtab_entry(self.dynstr, entries[-1].d_ptr_or_val) if entries else b""
+
+        if new_soname and new_soname != cur_value(DT_SONAME):
+            return False
+        if new_rpath and new_rpath != cur_value(DT_RPATH):
+            return False
+
+        names = {get_strtab_entry(self.dynstr, d.d_ptr_or_val) for d in self.dyn_by_tag.get(DT_NEEDED, [])}
+        names.update(ve.verneed_name for ve in self.verneed_entries)
+        return all(needed_replacements.get(name, name) == name for name in names)
 
     def rewrite(
         self,
@@ -1179,6 +1260,9 @@ class ElfFile:
             raise ValueError("ELF e_type must be ET_EXEC or ET_DYN")
 
         needed_replacements = needed_replacements or {}
+        if self._rewrite_is_noop(new_soname, new_rpath, needed_replacements):
+            self._release_data()
+            return
 
         self._fh.seek(0, io.SEEK_END)
         file_end = self._fh.tell()
@@ -1210,6 +1294,8 @@ class ElfFile:
             add_new_load=add_new_load,
         )
 
+        self._release_data()
+
         if add_new_load:
             # Zero pad to the start of our new page
             fzero(self._fh, file_end, new_offset - file_end)
@@ -1222,80 +1308,72 @@ class ElfFile:
 
         self._update_dynamic_symbol(dynamic_pos)
 
-        hdr = copy.deepcopy(self.ehdr)
+        hdr = copy.copy(self.ehdr)
         hdr.e_phoff = phdr_pos.file_offset
         hdr.e_phnum = phdr_pos.count
         hdr.e_shoff = shdr_pos.file_offset
         hdr.e_shnum = shdr_pos.count
         self._fh.seek(0)
         hdr.to_fileobj(self._fh)
+        self._fh.flush()
 
         self._clear_read_cache()
 
+    # The names of all of the @cached_property values above, collected once when the class is defined.
+    _cached_properties = frozenset(k for k, v in locals().items() if isinstance(v, cached_property))
+
 
-def read_c_str(fh: BinaryIO) -> bytes:
-    start = fh.tell()
-    data = b""
-    while True:
-        read = fh.read(32)  # read 32 bytes at a time
-        if not read:
-            # Just return what we have.
-            return data
+def unpack_structure(data: Union[mmap.mmap, bytes], offset: int, cls: Type[_R]) -> _R:
+    """Unpacks a single cls structure at offset."""
+    return cls.from_tuple(cls._struct_.unpack_from(data, offset))
 
-        data += read
-        null_pos = data.find(0)
-        if null_pos >= 0:
-            data = data[:null_pos]
-            fh.seek(start + len(data) + 1)  # Seek after the null
-            break
 
-    return data
+def unpack_structures(data: Union[mmap.mmap, bytes], offset: int, cls: Type[_R], count: int) -> List[_R]:
+    """Unpacks a table of count consecutive cls structures starting at offset."""
+    st = cls._struct_
+    end = offset + count * st.size
+    if end > len(data):
+        raise ValueError(f"Unexpected end of file reading {count} {cls.__name__} entries")
+    return [cls.from_tuple(values) for values in st.iter_unpack(data[offset:end])]
 
 
 def get_strtab_entry(strtab: bytes, start: int) -> bytes:
-    end = start
-    while end < len(strtab) and strtab[end] != 0:
-        end += 1
-    return strtab[start:end]
+    end = strtab.find(b"\0", start)
+    return strtab[start:] if end < 0 else strtab[start:end]
 
 
 def build_dynstr(soname: bytes, rpath: bytes, needed: Set[bytes], vernaux_versions: Set[bytes], prefix=b"") -> Dynstr:
-    result = prefix + b"$PATCH$\0"
-    soname_pos = len(result)
-    result += soname + b"\0"
-    rpath_pos = len(result)
-    result += rpath + b"\0"
+    # Collect the entries and join them once at the end; the prefix can be large, so it shouldn't be
+    # copied for every entry that's appended.
+    parts = [prefix, b"$PATCH$\0"]
+    size = len(prefix) + len(parts[1])
 
-    needed_pos = {}
-    for needed_entry in sorted(needed):
-        needed_pos[needed_entry] = len(result)
-        result += needed_entry + b"\0"
+    def append(entry: bytes) -> int:
+        nonlocal size
+        pos = size
+        parts.append(entry)
+        parts.append(b"\0")
+        size += len(entry) + 1
+        return pos
 
-    vernaux_pos = {}
-    for vernaux_entry in sorted(vernaux_versions):
-        vernaux_pos[vernaux_entry] = len(result)
-        result += vernaux_entry + b"\0"
+    soname_pos = append(soname)
+    rpath_pos = append(rpath)
+    needed_pos = {needed_entry: append(needed_entry) for needed_entry in sorted(needed)}
+    vernaux_pos = {vernaux_entry: append(vernaux_entry) for vernaux_entry in sorted(vernaux_versions)}
 
-    return Dynstr(result, soname_pos, rpath_pos, needed_pos, vernaux_pos)
+    return Dynstr(b"".join(parts), soname_pos, rpath_pos, needed_pos, vernaux_pos)
 
 
 def congruent_vm_addr(file_offset: int, vm_start: int, page_size: int) -> int:
     """Returns the vm addr >= vm_start where file_offset % page_size == val % page_size"""
-    fmod = file_offset % page_size
-    vmod = vm_start % page_size
-    if vmod < fmod:
-        return vm_start + (fmod - vmod)
-    elif vmod > fmod:
-        return vm_start + (page_size - (vmod - fmod))
-    else:
-        return vm_start
+    # Python's % is never negative for a positive page_size, so this is the distance up to the next congruent addr.
+    return vm_start + (file_offset - vm_start) % page_size
 
 
 if __name__ == "__main__":
     import sys
 
-    with open(sys.argv[1], "r+b") as f:
-        ef = ElfFile(f)
+    with open(sys.argv[1], "r+b") as f, ElfFile(f) as ef:
         ef.rewrite(new_soname=b"foojfkdlsjklfjdskjfkdslfds")
         ef.rewrite(new_rpath=b"/tmp")
         ef.rewrite(new_soname=b"foo")
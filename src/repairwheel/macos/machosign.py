@@ -1,7 +1,6 @@
 import dataclasses
 import hashlib
 import logging
-import math
 import os.path
 import sys
 from typing import BinaryIO
@@ -143,20 +142,41 @@ class cs_requirements_blob(Structure):
     ]
 
 
+# An empty requirements blob and its hash, and an empty signature wrapper blob. These are the
+# same for every signature.
+EMPTY_REQUIREMENTS_BYTES = cs_requirements_blob(
+    magic=CSMAGIC_REQUIREMENTS,
+    length=sizeof(cs_requirements_blob),
+    data=0,
+).to_str()
+EMPTY_REQUIREMENTS_HASH = hashlib.sha256(EMPTY_REQUIREMENTS_BYTES).digest()
+assert len(EMPTY_REQUIREMENTS_HASH) == SHA256_HASH_SIZE
+
+EMPTY_WRAPPER_BYTES = cs_generic_blob(
+    magic=CSMAGIC_BLOBWRAPPER,
+    length=sizeof(cs_generic_blob),
+).to_str()
+
+
 def log2(val: int) -> int:
-    return int(math.log2(val))
+    # Only used with powers of two.
+    return val.bit_length() - 1
 
 
 def iterate_page_hashes(fh: BinaryIO, offset: int, limit: int) -> Iterable[bytes]:
+    # Read many pages per seek into a reused buffer, and hash each page from a view of it.
+    buf = memoryview(bytearray(CODE_DIRECTORY_PAGE_SIZE * 256))
     read_pos = offset
     while read_pos < limit:
         initial_pos = fh.tell()
-        page_size = min(CODE_DIRECTORY_PAGE_SIZE, limit - read_pos)
         fh.seek(read_pos)
-        page_bytes = fh.read(page_size)
-        read_pos = fh.tell()
+        read = fh.readinto(buf[: min(len(buf), limit - read_pos)])
         fh.seek(initial_pos)
-        yield hashlib.sha256(page_bytes).digest()
+        if not read:
+            break
+        for page_start in range(0, read, CODE_DIRECTORY_PAGE_SIZE):
+            yield hashlib.sha256(buf[page_start : min(page_start + CODE_DIRECTORY_PAGE_SIZE, read)]).digest()
+        read_pos += read
 
 
 @dataclasses.dataclass
@@ -169,46 +189,27 @@ class SuperBlob:
 
     @property
     def page_count(self) -> int:
-        return math.ceil(self.code_limit / CODE_DIRECTORY_PAGE_SIZE)
+        return (self.code_limit + CODE_DIRECTORY_PAGE_SIZE - 1) // CODE_DIRECTORY_PAGE_SIZE
 
     @property
     def length(self) -> int:
-        # To compute the length, we just write the whole structure to a
-        # fake io object that tracks position. Page hashes are null, but
-        # the proper length.
-        class _CountingIO:
-            def __init__(self):
-                self.pos = 0
-
-            def write(self, data: bytes) -> int:
-                self.pos += len(data)
-                return len(data)
-
-            def seek(self, pos: int) -> int:
-                self.pos = pos
-                return pos
-
-            def tell(self) -> int:
-                return self.pos
-
-        counting = _CountingIO()
-        hashes = ("\0" * SHA256_HASH_SIZE for _ in range(self.page_count))
-        self.write(counting, hashes)
-        return counting.tell()
+        # Must match the layout produced by write().
+        return (
+            sizeof(cs_super_blob)
+            + sizeof(cs_blob_index) * 3
+            + sizeof(cs_code_directory)
+            + len(self.identifier.encode("utf-8"))
+            + 1  # identifier null terminator
+            + SHA256_HASH_SIZE * 2  # special slots
+            + SHA256_HASH_SIZE * self.page_count
+            + sizeof(cs_requirements_blob)
+            + sizeof(cs_generic_blob)
+        )
 
     def write(self, fh: BinaryIO, hashes: Iterable[bytes]):
         # remember our starting position
         super_blob_offset = fh.tell()
 
-        # Generate an empty requirements blob and its hash, which we'll use later.
-        requirements_bytes = cs_requirements_blob(
-            magic=CSMAGIC_REQUIREMENTS,
-            length=sizeof(cs_requirements_blob),
-            data=0,
-        ).to_str()
-        requirements_hash = hashlib.sha256(requirements_bytes).digest()
-        assert len(requirements_hash) == SHA256_HASH_SIZE
-
         # Setup the super blob structure. Length will be added later.
         super = cs_super_blob(
             magic=CSMAGIC_EMBEDDED_SIGNATURE,
@@ -264,7 +265,7 @@ class SuperBlob:
         fh.write(b"\0")  # null terminator
 
         # Write our two special hashes: the requirements hash and the null Info.plist hash
-        fh.write(requirements_hash)
+        fh.write(EMPTY_REQUIREMENTS_HASH)
         fh.write(b"\0" * SHA256_HASH_SIZE)
 
         dir.hashoffset = fh.tell() - dir_offset
@@ -282,14 +283,11 @@ class SuperBlob:
 
         # Write the resources blob and record its offset
         index_requirements.offset = fh.tell() - super_blob_offset
-        fh.write(requirements_bytes)
+        fh.write(EMPTY_REQUIREMENTS_BYTES)
 
         # Write the trailing wrapper blob and record its offset
         index_wrapper.offset = fh.tell() - super_blob_offset
-        cs_generic_blob(
-            magic=CSMAGIC_BLOBWRAPPER,
-            length=sizeof(cs_generic_blob),
-        ).to_fileobj(fh)
+        fh.write(EMPTY_WRAPPER_BYTES)
 
         # Record the final length of the super blob.
         end = fh.tell()
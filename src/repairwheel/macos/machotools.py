@@ -16,6 +16,7 @@ from macholib.mach_o import LC_LOAD_WEAK_DYLIB
 from macholib.mach_o import LC_REEXPORT_DYLIB
 from macholib.mach_o import LC_RPATH
 from macholib.mach_o import get_cpu_subtype
+from repairwheel._vendor.delocate.tools import _is_macho_file
 
 from . import machosign
 
@@ -163,6 +164,9 @@ def get_install_names(filename: str) -> Tuple[str, ...]:
 
         return tuple(results)
 
+    if not _is_macho_file(filename):
+        return ()
+
     try:
         macho = MachO(filename)
         return _all_arches_same_value(macho, _val)
@@ -198,6 +202,9 @@ def get_install_id(filename: str) -> Optional[str]:
             _, cmd, _ = entry
             return lc_str_value(cmd.name, entry).decode("utf-8")
 
+    if not _is_macho_file(filename):
+        return None
+
     try:
         macho = MachO(filename)
         return _all_arches_same_value(macho, _val)
@@ -310,6 +317,9 @@ def get_rpaths(filename: str) -> Tuple[str, ...]:
 
         return tuple(results)
 
+    if not _is_macho_file(filename):
+        return ()
+
     try:
         macho = MachO(filename)
         return _all_arches_same_value(macho, _val)